@@ -1,13 +1,38 @@
 from __future__ import annotations
 from types import NoneType
-from jsonschema import validate as check_schema
-from numpy import float64, floor, ceil, abs, min, max, round
-import math
-from pandas import DataFrame, Series, read_csv, concat
+from jsonschema.validators import validator_for
+from numpy import (
+    float64,
+    int32,
+    intp,
+    floor,
+    ceil,
+    abs,
+    min,
+    max,
+    round,
+    full,
+    nan,
+    ndarray,
+    fromiter,
+    errstate,
+)
+from pandas import (
+    Categorical,
+    DataFrame,
+    Index,
+    Series,
+    concat,
+)
 import json
 from datetime import datetime
 from pathlib import Path
 from functools import partial
+from collections import deque
+from collections.abc import Callable, Collection
+import ast
+
+from .utils import read_csv
 
 
 class CyclicDependencyError(Exception):
@@ -17,6 +42,11 @@ class CyclicDependencyError(Exception):
 with open(Path(__file__).parent / "schema.json") as file:
     schema = json.load(file)
 
+# Checking the schema and building the validator is done once at import
+Validator = validator_for(schema)
+Validator.check_schema(schema)
+validator = Validator(schema)
+
 
 def load_csv(
     root: Path | str,
@@ -37,18 +67,12 @@ def load_csv(
     return res
 
 
-def clean_nan(obj):
-    if isinstance(obj, float) and math.isnan(obj):
-        return None
-    if isinstance(obj, dict):
-        return {k: clean_nan(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [clean_nan(v) for v in obj]
-    return obj
+def clean_nan(serie: Series) -> dict:
+    return serie.astype(object).where(serie.notna(), None).to_dict()
 
 
 def validate(data: dict):
-    check_schema(instance=data, schema=schema)
+    validator.validate(data)
 
 
 def validate_column_name(name: str):
@@ -56,7 +80,101 @@ def validate_column_name(name: str):
         raise ValueError("Columns name must be valid identifier")
 
 
+def formula_names(formula: str) -> set[str]:
+    """Names a formula reads from its namespace"""
+    tree = ast.parse(formula, mode="eval")
+    loaded = set()
+    bound = set()  # comprehension targets and lambda arguments
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loaded.add(node.id)
+            else:
+                bound.add(node.id)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+    return loaded - bound
+
+
+ARITHMETIC_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Call,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.Mod,
+    ast.Pow,
+    ast.UAdd,
+    ast.USub,
+)
+
+
+def is_arithmetic_formula(formula: str, functions: Collection[str]) -> bool:
+    """Arithmetic on column names, numbers and calls to `functions` only"""
+    tree = ast.parse(formula, mode="eval")
+    has_name = False
+    for node in ast.walk(tree):
+        if not isinstance(node, ARITHMETIC_NODES):
+            return False
+        if isinstance(node, ast.Name):
+            has_name = True
+        if isinstance(node, ast.Constant) and (
+            isinstance(node.value, bool) or not isinstance(node.value, (int, float))
+        ):
+            return False
+        if isinstance(node, ast.Call) and not (
+            isinstance(node.func, ast.Name)
+            and node.func.id in functions
+            and len(node.keywords) == 0
+        ):
+            return False
+    return has_name
+
+
+KERNEL_FUNCTIONS = {"abs": abs, "ceil": ceil, "floor": floor, "round": round}
+
+kernels: dict[str, tuple[Callable, list[str]]] = {}
+
+
+class RenameColumns(ast.NodeTransformer):
+    def __init__(self, columns: list[str]):
+        self.columns = columns
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in self.columns:
+            return ast.Name(f"_a{self.columns.index(node.id)}", node.ctx)
+        return node
+
+
+def kernel(formula: str) -> tuple[Callable, list[str]]:
+    """Function taking the referenced columns as arrays, and their names"""
+    if formula not in kernels:
+        columns = sorted(formula_names(formula) - KERNEL_FUNCTIONS.keys())
+        tree = RenameColumns(columns).visit(ast.parse(formula, mode="eval"))
+        params = ", ".join(f"_a{i}" for i in range(len(columns)))
+        ns: dict = dict(KERNEL_FUNCTIONS)
+        exec(f"def kernel({params}):\n    return {ast.unparse(tree)}", ns)
+        kernels[formula] = (ns["kernel"], columns)
+    return kernels[formula]
+
+
 class Document:
+    BUILTINS = {
+        "__builtins__": {},
+        "max": max,
+        "min": min,
+        "ceil": ceil,
+        "floor": floor,
+        "round": round,
+        "abs": abs,
+    }
+
     def __init__(
         self,
         title: str,
@@ -65,13 +183,28 @@ class Document:
         date: datetime,
         filename: str | None = None,
     ):
-        self.__source = DataFrame()
+        # source columns are stored as arrays sharing the same row positions,
+        # with spare capacity so that adding a row rarely reallocates
+        self.__arrays: dict[str, ndarray] = {}
+        # string columns are stored as category codes, -1 being a missing value
+        self.__categories: dict[str, dict[str, int]] = {}
+        self.__rows: dict[str, int] = {}
+        self.__capacity = 0
+        self.__row_index: Index | None = None
+        self.__frame: DataFrame | None = None
         self.__computed = {}
+        self.__compiled = {}
+        self.__vectorized: dict[str, bool] = {}
+        self.__deps: dict[str, set[str]] = {}
+        self.__rdeps: dict[str, set[str]] = {}
+        self.__order: list[str] | None = None
         self.__title = title
         self.__code = code
         self.__date = date
         self.__course = course
         self.__filename = filename
+        self.__values: dict[str, Series] = {}
+        self.__cache: DataFrame | None = None
         self.dirty = False
 
     @property
@@ -117,6 +250,8 @@ class Document:
     @filename.setter
     def filename(self, value):
         self.__filename = value
+        # csv() paths in formulas are resolved relative to the filename
+        self.__invalidate()
         self.dirty = True
 
     @staticmethod
@@ -150,43 +285,167 @@ class Document:
                 self.add_computed_column(column["name"], column["formula"])
         return self
 
+    def __empty(self, dtype) -> ndarray:
+        if dtype == float64:
+            return full(self.__capacity, nan)
+        return full(self.__capacity, -1, dtype=int32)
+
+    def __category_code(self, name: str, value: str) -> int:
+        categories = self.__categories[name]
+        if value not in categories:
+            categories[value] = len(categories)
+        return categories[value]
+
+    def __reserve(self, capacity: int):
+        self.__capacity = capacity
+        for name, array in self.__arrays.items():
+            grown = self.__empty(array.dtype)
+            grown[: len(array)] = array
+            self.__arrays[name] = grown
+
+    def __append_row(self, index: str) -> int:
+        position = len(self.__rows)
+        if position == self.__capacity:
+            self.__reserve(2 * self.__capacity if self.__capacity > 0 else 8)
+        self.__rows[index] = position
+        self.__row_index = None
+        self.__frame = None
+        return position
+
+    @property
+    def __index(self) -> Index:
+        if self.__row_index is None:
+            self.__row_index = Index(list(self.__rows))
+        return self.__row_index
+
+    def __serie(self, name: str) -> Series:
+        array = self.__arrays[name][: len(self.__rows)]
+        if name in self.__categories:
+            categorical = Categorical.from_codes(
+                array, categories=list(self.__categories[name])
+            )
+            # formulas expect plain strings (e.g. for concatenation), and
+            # astype(str) would turn missing values into "nan" before pandas 3
+            return Series(categorical, index=self.__index, name=name).astype(object)
+        return Series(array, index=self.__index, name=name, copy=False)
+
+    @property
+    def __source(self) -> DataFrame:
+        if self.__frame is None:
+            self.__frame = DataFrame(
+                {name: self.__serie(name) for name in self.__arrays},
+                index=self.__index,
+            )
+        return self.__frame
+
     def add_source_column(self, name: str, column: dict):
         validate_column_name(name)
         if all(isinstance(index, str) for index in column):
             if all(
                 isinstance(value, (float, int, NoneType)) for value in column.values()
             ):
-                serie = Series(column, dtype=float64)
+                dtype = float64
             elif all(isinstance(value, (str, NoneType)) for value in column.values()):
-                serie = Series(column)
+                dtype = int32
             else:
                 raise ValueError("Values must be all the same type (number or string)")
-            self.__source[name] = serie
         else:
             raise ValueError("Indexes must be str")
+
+        if dtype == int32:
+            self.__categories[name] = {}
+            values = fromiter(
+                (
+                    -1 if value is None else self.__category_code(name, value)
+                    for value in column.values()
+                ),
+                dtype=int32,
+                count=len(column),
+            )
+        else:
+            self.__categories.pop(name, None)
+            values = fromiter(
+                (nan if value is None else value for value in column.values()),
+                dtype=float64,
+                count=len(column),
+            )
+
+        # the first column defines the rows, next ones are aligned on them
+        new_rows = len(self.__rows) == 0 and len(column) > 0
+        if new_rows:
+            if len(column) > self.__capacity:
+                self.__reserve(len(column))
+            self.__rows = {index: position for position, index in enumerate(column)}
+            self.__row_index = None
+            array = self.__empty(dtype)
+            array[: len(column)] = values
+        else:
+            positions = fromiter(
+                (self.__rows.get(index, -1) for index in column),
+                dtype=intp,
+                count=len(column),
+            )
+            known = positions >= 0
+            array = self.__empty(dtype)
+            array[positions[known]] = values[known]
+        self.__arrays[name] = array
+        self.__frame = None
+        if new_rows:
+            self.__invalidate()
+        else:
+            self.__invalidate(name)
         self.dirty = True
 
-    def add_computed_column(self, name: str, formula: str):
-        validate_column_name(name)
+    def __invalidate(self, name: str | None = None):
+        """Forget the computed values depending on `name`, or all of them"""
+        self.__cache = None
+        if name is None:
+            self.__values.clear()
+            return
+
+        stale = {name}
+        queue = [name]
+        while len(queue) > 0:
+            for dependent in self.__rdeps.get(queue.pop(), ()):
+                if dependent not in stale:
+                    stale.add(dependent)
+                    queue.append(dependent)
+        for column in stale:
+            self.__values.pop(column, None)
+
+    def __set_formula(self, name: str, formula: str):
+        # an invalid formula must raise before the previous one is unregistered
+        deps = formula_names(formula)
+        compiled = compile(formula, f"<formula:{name}>", "eval")
+        vectorized = is_arithmetic_formula(formula, KERNEL_FUNCTIONS)
+        for dep in self.__deps.get(name, ()):
+            self.__rdeps[dep].discard(name)
+        self.__deps[name] = deps
+        for dep in deps:
+            self.__rdeps.setdefault(dep, set()).add(name)
+        self.__compiled[name] = compiled
+        self.__vectorized[name] = vectorized
         self.__computed[name] = formula
+        self.__order = None
+        self.__invalidate(name)
         self.dirty = True
 
+    def add_computed_column(self, name: str, formula: str):
+        validate_column_name(name)
+        self.__set_formula(name, formula)
+
     def add_row(self, index: str):
-        if index in self.indexes:
+        if index in self.__rows:
             raise IndexError("Index already exist")
 
-        values = {}
-        for column in self.__source.columns:
-            values[column] = None
-
-        self.__source.loc[index] = values
+        self.__append_row(index)
+        self.__invalidate()
         self.dirty = True
 
     def set_formula(self, name: str, formula: str):
         if name not in self.__computed:
             raise IndexError(f"{name} is not a computed column")
-        self.__computed[name] = formula
-        self.dirty = True
+        self.__set_formula(name, formula)
 
     def formula(self, name: str) -> str:
         if name not in self.__computed:
@@ -195,55 +454,88 @@ class Document:
 
     @property
     def column_names(self):
-        return list(self.__source.columns) + list(self.__computed)
+        return list(self.__arrays) + list(self.__computed)
 
-    def __compute_column(self, df: DataFrame, name: str):
+    def __compute_column(self, ns: dict, name: str) -> Series:
         # TODO: Add builtins to load csv and/or json
 
-        if self.filename is None:
-            root = Path.cwd()
-        else:
-            root = Path(self.filename).parent
-
-        ns: dict = {
-            "__builtins__": {},
-            "max": max,
-            "min": min,
-            "ceil": ceil,
-            "floor": floor,
-            "round": round,
-            "abs": abs,
-            "csv": partial(load_csv, root),
-        }
-        for col in df.columns:
-            ns[col] = df[col]
-        # df[name] = eval(self.__computed[name], ns)
-        s = eval(self.__computed[name], ns)
-        df = concat([df, s.rename(name)], axis=1)
-        return df
+        for dep in self.__deps[name]:
+            if dep not in ns:
+                raise NameError(f"`{dep}` used by `{name}` is not a column", name=dep)
+
+        deps = [ns[dep] for dep in self.__deps[name] if dep not in self.BUILTINS]
+        index = self.__index
+        if self.__vectorized[name] and all(
+            isinstance(dep, Series)
+            and dep.dtype == "float64"
+            and dep.index.equals(index)
+            for dep in deps
+        ):
+            formula = self.__computed[name]
+            function, columns = kernel(formula)
+            arrays = [ns[col].to_numpy() for col in columns]
+            # silent like Series arithmetic (e.g. division by zero)
+            with errstate(all="ignore"):
+                return Series(function(*arrays), index=index)
+        return eval(self.__compiled[name], ns)
+
+    def __evaluation_order(self) -> list[str]:
+        if self.__order is not None:
+            return self.__order
+
+        # Kahn's algorithm over the computed columns dependency graph
+        in_degree = {name: 0 for name in self.__computed}
+        dependents: dict[str, list[str]] = {name: [] for name in self.__computed}
+        for name in self.__computed:
+            for dep in self.__deps[name]:
+                if dep in self.__computed:
+                    in_degree[name] += 1
+                    dependents[dep].append(name)
+
+        queue = deque(name for name, degree in in_degree.items() if degree == 0)
+        order = []
+        while len(queue) > 0:
+            name = queue.popleft()
+            order.append(name)
+            for dependent in dependents[name]:
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
+
+        if len(order) < len(self.__computed):
+            raise CyclicDependencyError()
+        self.__order = order
+        return order
 
     def compute(self) -> DataFrame:
-        df = self.__source.copy()
-        to_compute = list(self.__computed.keys())
-        max_iter = len(to_compute) ** 2
-        count = 0
-        while len(to_compute) > 0:
-            if count > max_iter:
-                raise CyclicDependencyError()
-            name = to_compute.pop(0)
-            try:
-                df = self.__compute_column(df, name)
-            except NameError as e:
-                if e.name not in self.__computed:
-                    raise e
-                else:
-                    to_compute.append(name)
-            count += 1
+        if self.__cache is not None:
+            return self.__cache
+
+        order = self.__evaluation_order()
+        stale = [name for name in order if name not in self.__values]
+        if len(stale) > 0:
+            if self.filename is None:
+                root = Path.cwd()
+            else:
+                root = Path(self.filename).parent
+
+            # built once per compute and completed as formulas are evaluated
+            ns: dict = {**self.BUILTINS, "csv": partial(load_csv, root)}
+            ns.update((name, self.__serie(name)) for name in self.__arrays)
+            ns.update(self.__values)
+            for name in stale:
+                self.__values[name] = ns[name] = self.__compute_column(ns, name)
+        computed = DataFrame({name: self.__values[name] for name in order})
+        df = concat([self.__source, computed], axis=1)
+        self.__cache = df
         return df
 
     def column(self, column_name: str) -> dict:
         return self.compute()[column_name].to_dict()
 
+    def column_values(self, column_name: str) -> list:
+        return self.compute()[column_name].tolist()
+
     def is_computed(self, column) -> bool:
         return column in self.__computed
 
@@ -255,7 +547,16 @@ class Document:
         return self.compute().index.to_list()
 
     def column_type(self, name: str) -> str:
-        if self.compute()[name].dtype == "float64":
+        if name in self.__categories:
+            return "string"
+        if name in self.__arrays:
+            dtype = self.__arrays[name].dtype
+        elif isinstance(self.__values.get(name), Series):
+            # still valid even when other columns need recomputing
+            dtype = self.__values[name].dtype
+        else:
+            dtype = self.compute()[name].dtype
+        if dtype == "float64":
             return "number"
         else:
             return "string"
@@ -265,16 +566,14 @@ class Document:
             raise ValueError("No filename")
 
         columns = []
-        for name in self.__source.columns:
-            # print(
-            #     type(dict(self.column(name))["11111"]), dict(self.column(name))["11111"]
-            # )
+        for name in self.__arrays:
+            # source rows are never derived, no need to compute the document
             columns.append(
                 {
                     "type": "source",
                     "dtype": self.column_type(name),
                     "name": name,
-                    "rows": clean_nan(dict(self.column(name))),
+                    "rows": clean_nan(self.__serie(name)),
                 }
             )
 
@@ -291,29 +590,53 @@ class Document:
             "columns": columns,
         }
         with open(self.filename, "w", encoding="utf8") as file:
-            json.dump(res, file, indent=4)
+            file.write(json.dumps(res, indent=4))
         self.dirty = False
 
+    def source_value(self, row: str, column: str):
+        """Value of a source cell, read without computing the document"""
+        value = self.__arrays[column][self.__rows[row]]
+        if column not in self.__categories:
+            return float(value)
+        if value < 0:
+            return nan
+        return list(self.__categories[column])[value]
+
     def __getitem__(self, coords: tuple[str, str]):
         return self.compute().loc[coords]
 
     def __setitem__(self, coords: tuple[str, str], value):
-        _, column = coords
-        if column in self.__source.columns:
-            if self.__source[column].dtype == "float64" and not isinstance(
-                value, (float, int)
-            ):
+        row, column = coords
+        if column in self.__arrays:
+            string = column in self.__categories
+            if not string and not isinstance(value, (float, int)):
                 raise TypeError(f"`{value}` is incompatible with column type `number`")
-            if self.__source[column].dtype == "object" and not isinstance(value, str):
+            if string and not isinstance(value, str):
                 raise TypeError(f"`{value}` is incompatible with column type `string`")
-            self.__source.loc[coords] = value
         else:
             validate_column_name(column)
             if column in self.__computed:
                 raise IndexError("Cannot assign values to cells of a computed column")
             if not isinstance(value, (int, float, str)):
                 raise TypeError("Document only support number and string columns")
-            self.__source.loc[coords] = value
+
+        new_row = row not in self.__rows
+        if new_row:
+            self.__append_row(row)
+        if column not in self.__arrays:
+            if isinstance(value, str):
+                self.__arrays[column] = self.__empty(int32)
+                self.__categories[column] = {}
+            else:
+                self.__arrays[column] = self.__empty(float64)
+        if column in self.__categories:
+            value = self.__category_code(column, value)
+        self.__arrays[column][self.__rows[row]] = value
+        self.__frame = None
+        if new_row:
+            self.__invalidate()
+        else:
+            self.__invalidate(column)
         self.dirty = True
 
     def __str__(self):
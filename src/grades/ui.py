@@ -1,9 +1,11 @@
 from datetime import datetime
-from typing import Any, Callable
+from jsonschema import ValidationError
+from typing import TYPE_CHECKING, Any, Callable, cast
 from rich.text import Text
+from textual import work
 from textual.app import App, ComposeResult
 from textual.containers import Grid, Container
-from textual.widgets import Button, Footer, Header, DataTable, Label, Input, TextArea
+from textual.widgets import Button, Footer, Header, DataTable, Label, Input
 from textual.widgets.data_table import RowKey, ColumnKey
 from textual.screen import ModalScreen
 from textual.message import Message
@@ -11,6 +13,11 @@ from textual.validation import Function
 from .document import Document
 from pathlib import Path
 
+if TYPE_CHECKING:
+    from textual.widgets import TextArea
+
+PAGE_ROWS = 200
+
 
 def is_date(value: str) -> bool:
     try:
@@ -20,7 +27,23 @@ def is_date(value: str) -> bool:
         return False
 
 
+def same_value(a, b) -> bool:
+    # NaN is not equal to itself
+    return a == b or (a != a and b != b)
+
+
+def format_number(value: float) -> str:
+    # missing values are shown as empty cells
+    return "" if value != value else f"{value:.15g}"
+
+
+def format_string(value) -> str:
+    return "" if value != value else str(value)
+
+
 class SourceCellUpdate(Message):
+    __slots__ = ("row", "column", "value")
+
     def __init__(self, row: str, column: str, value):
         self.row = row
         self.column = column
@@ -29,6 +52,8 @@ class SourceCellUpdate(Message):
 
 
 class ComputedColumnUpdate(Message):
+    __slots__ = ("column", "formula")
+
     def __init__(self, column: str, formula: str):
         self.column = column
         self.formula = formula
@@ -36,12 +61,16 @@ class ComputedColumnUpdate(Message):
 
 
 class StartEditFormula(Message):
+    __slots__ = ("column",)
+
     def __init__(self, column: str):
         self.column = column
         super().__init__()
 
 
 class AddColumn(Message):
+    __slots__ = ("name", "computed")
+
     def __init__(self, name: str, computed: bool):
         self.name = name
         self.computed = computed
@@ -49,27 +78,36 @@ class AddColumn(Message):
 
 
 class AddRow(Message):
+    __slots__ = ("index",)
+
     def __init__(self, index: str):
         self.index = index
         super().__init__()
 
 
 class Sheet(DataTable):
+    def watch_scroll_y(self, old_value: float, new_value: float):
+        super().watch_scroll_y(old_value, new_value)
+        # once the table is done with the current update
+        self.call_after_refresh(self.load_more, int(new_value) + self.size.height)
+
+    def on_data_table_cell_highlighted(self, event: DataTable.CellHighlighted):
+        self.load_more(event.coordinate.row)
+
+    def load_more(self, row: int):
+        if row + PAGE_ROWS // 2 > self.row_count:
+            self.app.load_rows(self.row_count + PAGE_ROWS)  # type: ignore
+
     def on_data_table_cell_selected(self, event: DataTable.CellSelected):
         col_name = event.cell_key.column_key.value
         assert col_name is not None
         if isinstance(event.value, Text):
             self.post_message(StartEditFormula(col_name))
         else:
-            type = str if self.app.doc.column_type(col_name) == "string" else float  # type: ignore
+            type = self.app.coercers[col_name]  # type: ignore
             value = "" if event.value is None else str(event.value)
-            self.app.push_screen(
-                CellInputScreen(
-                    event.cell_key.row_key,
-                    event.cell_key.column_key,
-                    value,
-                    type,
-                )
+            self.app.edit_cell(  # type: ignore
+                event.cell_key.row_key, event.cell_key.column_key, value, type
             )
 
 
@@ -203,6 +241,9 @@ class FormulaInputScreen(ModalScreen):
         self.formula = formula
 
     def compose(self) -> ComposeResult:
+        # the editor is the only slow widget to import, load it on first use
+        from textual.widgets import TextArea
+
         yield Grid(
             TextArea.code_editor(self.formula, language="python"),
             Button("Ok", variant="success", id="ok"),
@@ -216,7 +257,7 @@ class FormulaInputScreen(ModalScreen):
             self.action_cancel()
 
     def action_submit(self):
-        formula = self.query_one(TextArea)
+        formula = cast("TextArea", self.query_one("TextArea"))
         self.post_message(ComputedColumnUpdate(self.column, formula.text))
         self.app.pop_screen()
 
@@ -243,23 +284,53 @@ class CellInputScreen(ModalScreen):
         self.column = column
         self.type = type
         self.cursor = cursor
+        self.submitted = False
+
+    def configure(
+        self,
+        row: RowKey,
+        column: ColumnKey,
+        value: str,
+        type: Callable,
+        cursor: str = "replace",
+    ):
+        """Reuse the screen for another cell"""
+        self.value = value
+        self.row = row
+        self.column = column
+        self.type = type
+        self.cursor = cursor
+        self.submitted = False
+        if self.is_mounted:
+            self.query_one("#column", Label).update(f"{column.value}")
+            self.query_one("#row", Label).update(f"{row.value}")
+            input = self.query_one(Input)
+            input.value = value
+            input.placeholder = value
+            input.focus()
+            self.place_cursor()
 
     def compose(self) -> ComposeResult:
         yield Grid(
             Container(),
-            Label(f"{self.column.value}"),
-            Label(f"{self.row.value}"),
+            Label(f"{self.column.value}", id="column"),
+            Label(f"{self.row.value}", id="row"),
             Input(self.value, placeholder=self.value),
             Button("Ok", variant="success", id="ok"),
             Button("Cancel", variant="primary", id="cancel"),
         )
 
     def on_mount(self):
+        self.place_cursor()
+
+    def place_cursor(self):
         input = self.query_one(Input)
         if self.cursor == "start":
             input.cursor_position = 0
         if self.cursor == "end":
             input.cursor_position = len(input.value)
+        if self.cursor == "replace":
+            input.select_all()
 
     def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "ok":
@@ -268,11 +339,25 @@ class CellInputScreen(ModalScreen):
             self.action_cancel()
 
     def on_input_submitted(self):
-        row = self.row.value
-        column = self.column.value
-        assert isinstance(row, str)
-        assert isinstance(column, str)
-        value = self.type(self.query_one(Input).value)
+        # Enter and the Ok button must not post the edit twice
+        if self.submitted:
+            return
+        text = self.query_one(Input).value
+        if text == self.value:
+            self.app.pop_screen()
+            return
+        if self.type is float and text.strip() == "":
+            # an empty number cell is a missing value
+            text = "nan"
+        try:
+            value = self.type(text)
+        except ValueError:
+            self.notify(f"`{text}` is not a number", severity="error")
+            return
+        self.submitted = True
+        # the table keys are the document indexes and column names
+        row = cast(str, self.row.value)
+        column = cast(str, self.column.value)
         self.post_message(SourceCellUpdate(row, column, value))
         self.app.pop_screen()
 
@@ -290,11 +375,23 @@ class UI(App):
         ("r", "add_row", "Add Row"),
         ("w", "save", "Write"),
         ("m", "metadata", "Metadata"),
+        ("l", "reload", "Reload"),
     ]
 
     def __init__(self, doc: Document):
         super().__init__()
         self.doc = doc
+        # what the table shows, filled by render_table()
+        self.columns: list[str] = []
+        self.indexes: list[str] = []
+        self.values: dict[str, list] = {}
+        self.computed: set[str] = set()
+        self.coercers: dict[str, Callable] = {}
+        self.formatters: dict[str, Callable] = {}
+        self.loaded = 0
+        self.pending_columns: set[str] = set()
+        self.pending_edits = 0
+        self.flush_timer = None
 
     def compose(self) -> ComposeResult:
         yield Header()
@@ -308,12 +405,32 @@ class UI(App):
         self.table.focus()
 
     def on_source_cell_update(self, event: SourceCellUpdate):
+        # compute() would undo the batching of the edits
+        if same_value(self.doc.source_value(event.row, event.column), event.value):
+            return
         self.doc[event.row, event.column] = event.value
-        coord = self.table.cursor_coordinate
-        self.render_table()
-        self.table.cursor_type = "cell"
-        self.table.focus()
-        self.table.cursor_coordinate = coord
+        # coalesce the edits arriving within the same frame
+        self.pending_columns.add(event.column)
+        self.pending_edits += 1
+        if self.flush_timer is None:
+            self.flush_timer = self.set_timer(0.016, self.flush_updates)
+
+    def flush_updates(self):
+        self.flush_timer = None
+        if self.pending_edits > 500:
+            self.log.warning(f"{self.pending_edits} cell edits in a frame")
+        self.pending_edits = 0
+        columns, self.pending_columns = self.pending_columns, set()
+        self.update_table(columns)
+
+    def edit_cell(self, row: RowKey, column: ColumnKey, value: str, type: Callable):
+        # the same input screen is kept installed and reused for every cell
+        if self.is_screen_installed("cell_input"):
+            screen = self.get_screen("cell_input")
+            screen.configure(row, column, value, type)  # type: ignore
+        else:
+            self.install_screen(CellInputScreen(row, column, value, type), "cell_input")
+        self.push_screen("cell_input")
 
     def on_start_edit_formula(self, event: StartEditFormula):
         formula = self.doc.formula(event.column)
@@ -349,25 +466,102 @@ class UI(App):
         self.table.focus()
         self.table.cursor_coordinate = coord
 
-    def render_table(self):
+    def render_title(self):
         self.title = f"{'⏺︎ ' if self.doc.dirty else ''}{self.doc.title} - {self.doc.code} - {self.doc.course} - {self.doc.date:%d-%m-%Y}"
-        self.table.clear(columns=True)
 
+    def render_table(self):
+        self.render_title()
         cols = self.doc.column_names
+        # one list per column rather than one dict per row
+        self.values = {key: self.doc.column_values(key) for key in cols}
+        self.indexes = self.doc.indexes
+        self.computed = {key for key in cols if self.doc.is_computed(key)}
+        loaded = self.loaded
+        self.loaded = 0
+        table = self.table
+        with self.batch_update():
+            if cols == self.columns:
+                # same columns, only the rows need to be rebuilt
+                table.clear()
+            else:
+                table.clear(columns=True)
+                add_column = table.add_column
+                for name in cols:
+                    label = name
+                    add_column(label, key=name)
+            self.columns = cols
+            # the types only change with the structure or the formulas
+            self.coercers = {
+                key: str if self.doc.column_type(key) == "string" else float
+                for key in cols
+            }
+            self.formatters = {
+                key: format_string if coercer is str else format_number
+                for key, coercer in self.coercers.items()
+            }
+            # the other rows are added when the table is scrolled to them
+            self.load_rows(max(loaded, PAGE_ROWS))
+
+    def load_rows(self, count: int):
+        """Add the rows of the table up to `count`"""
+        count = min(count, len(self.indexes))
+        if count <= self.loaded:
+            return
+        values = [self.values[key] for key in self.columns]
+        formatters = [self.formatters[key] for key in self.columns]
+        computed = [key in self.computed for key in self.columns]
+        add_row = self.table.add_row
+        # add_rows() can't set the row keys, add them one by one in a single refresh
+        with self.batch_update():
+            for i in range(self.loaded, count):
+                index = self.indexes[i]
+                # an inlined list comprehension unpacks faster than a generator
+                add_row(
+                    *[
+                        Text(formatter(column[i]), style="italic #03AC13")
+                        if is_computed
+                        else formatter(column[i])
+                        for column, formatter, is_computed in zip(
+                            values, formatters, computed
+                        )
+                    ],
+                    label=index,
+                    key=index,
+                )
+        self.loaded = count
 
-        for name in cols:
-            label = name
-            self.table.add_column(label, key=name)
-
-        for index in self.doc.indexes:
-            row = self.doc.index(index)
-            values = []
-            for key in cols:
-                if self.doc.is_computed(key):
-                    values.append(Text(str(row[key]), style="italic #03AC13"))
-                else:
-                    values.append(row[key])
-            self.table.add_row(*values, label=index, key=index)
+    def update_table(self, columns: set[str]):
+        """Update the cells that changed after an edit of `columns` cells"""
+        cols = self.doc.column_names
+        indexes = self.doc.indexes
+        if cols != self.columns or indexes != self.indexes:
+            coord = self.table.cursor_coordinate
+            self.render_table()
+            self.table.cursor_type = "cell"
+            self.table.focus()
+            self.table.cursor_coordinate = coord
+            return
+
+        self.render_title()
+        computed = [key for key in cols if self.doc.is_computed(key)]
+        # only the edited columns and the formulas can have changed
+        keys = [key for key in cols if key in columns] + computed
+        with self.batch_update():
+            for key in keys:
+                formatter = self.formatters[key]
+                values = self.doc.column_values(key)
+                last = self.values[key]
+                # the rows not added yet will be built from the new values
+                for index, value, old in zip(indexes[: self.loaded], values, last):
+                    if same_value(value, old):
+                        continue
+                    if key not in columns:
+                        cell = Text(formatter(value), style="italic #03AC13")
+                    else:
+                        cell = formatter(value)
+                    # grow the column when the new text is wider
+                    self.table.update_cell(index, key, cell, update_width=True)
+                self.values[key] = values
 
     def action_add_row(self):
         self.push_screen(AddRowScreen())
@@ -379,9 +573,37 @@ class UI(App):
         self.push_screen(AddColumnScreen(False))
 
     def action_save(self):
-        coord = self.table.cursor_coordinate
         # TODO: Deal with doc that don't have filename
         self.doc.save()
+        self.render_title()
+
+    @work(thread=True, exclusive=True)
+    def action_reload(self):
+        filename = self.doc.filename
+        if self.doc.dirty:
+            self.call_from_thread(
+                self.notify,
+                "Unsaved changes, save them before reloading",
+                severity="warning",
+            )
+            return
+        if filename is None or not Path(filename).exists():
+            self.call_from_thread(self.notify, "Nothing to reload", severity="warning")
+            return
+        # reading and parsing the file must not block the UI
+        try:
+            doc = Document.from_file(filename)
+        except (ValidationError, SyntaxError, ValueError, OSError) as error:
+            # keep the current document, a failed worker would exit the app
+            self.call_from_thread(
+                self.notify, f"Cannot reload: {error}", severity="error"
+            )
+            return
+        self.call_from_thread(self.install_doc, doc)
+
+    def install_doc(self, doc: Document):
+        coord = self.table.cursor_coordinate
+        self.doc = doc
         self.render_table()
         self.table.cursor_type = "cell"
         self.table.focus()
@@ -393,11 +615,7 @@ class UI(App):
             self.doc.code = result["code"]
             self.doc.course = result["course"]
             self.doc.date = result["date"]
-            coord = self.table.cursor_coordinate
-            self.render_table()
-            self.table.cursor_type = "cell"
-            self.table.focus()
-            self.table.cursor_coordinate = coord
+            self.render_title()
 
         data = {
             "title": self.doc.title,
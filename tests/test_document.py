@@ -0,0 +1,116 @@
+import json
+import math
+import warnings
+
+import pytest
+
+from grades import Document
+
+
+def test_invalid_formula_keeps_previous_dependencies():
+    doc = Document.new()
+    doc["a", "x"] = 1.0
+    doc.add_computed_column("y", "x * 2")
+    doc.add_computed_column("z", "y + 1")
+    assert doc["a", "z"] == 3
+
+    with pytest.raises(SyntaxError):
+        doc.set_formula("y", "abs(x")
+
+    assert doc.formula("y") == "x * 2"
+    doc["a", "x"] = 5.0
+    assert doc["a", "y"] == 10
+    assert doc["a", "z"] == 11
+
+
+def test_missing_strings_stay_missing(tmp_path):
+    doc = Document.new()
+    doc["a", "name"] = "Alice"
+    doc.add_row("b")
+    assert doc.compute()["name"].isna().tolist() == [False, True]
+
+    doc.filename = str(tmp_path / "doc.json")
+    doc.save()
+    with open(doc.filename) as file:
+        column = json.load(file)["columns"][0]
+    assert column["rows"] == {"a": "Alice", "b": None}
+
+
+def test_division_by_zero_does_not_warn():
+    doc = Document.new()
+    doc["a", "x"] = 1.0
+    doc["b", "x"] = 0.0
+    doc.add_computed_column("y", "x / 0")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert doc["a", "y"] == math.inf
+        assert math.isnan(doc["b", "y"])
+
+
+def test_source_value():
+    doc = Document.new()
+    doc["a", "x"] = 1.0
+    doc["a", "name"] = "Alice"
+    doc.add_row("b")
+    assert doc.source_value("a", "x") == 1.0
+    assert doc.source_value("a", "name") == "Alice"
+    assert math.isnan(doc.source_value("b", "x"))
+    assert math.isnan(doc.source_value("b", "name"))
+
+
+def test_add_existing_row():
+    doc = Document.new()
+    doc["a", "x"] = 1.0
+    with pytest.raises(IndexError):
+        doc.add_row("a")
+    doc.add_row("b")
+    assert doc.indexes == ["a", "b"]
+
+
+def test_rows_grow_past_initial_capacity():
+    doc = Document.new()
+    for i in range(20):
+        doc[f"s{i}", "x"] = float(i)
+    doc["s3", "name"] = "c"
+    assert doc.indexes == [f"s{i}" for i in range(20)]
+    assert doc.column("x") == {f"s{i}": float(i) for i in range(20)}
+    assert doc["s3", "name"] == "c"
+    assert math.isnan(doc.source_value("s19", "name"))
+
+
+def test_later_source_columns_are_aligned_on_rows():
+    doc = Document.new()
+    doc.add_source_column("x", {"a": 1.0, "b": 2.0, "c": 3.0})
+    doc.add_source_column("y", {"c": 30.0, "extra": 0.0, "a": 10.0})
+    assert doc.indexes == ["a", "b", "c"]
+    assert doc["a", "y"] == 10
+    assert math.isnan(doc["b", "y"])
+    assert doc["c", "y"] == 30
+
+
+def test_replace_string_column_with_number_column():
+    doc = Document.new()
+    doc.add_source_column("x", {"a": "one", "b": None})
+    assert doc.column_type("x") == "string"
+    doc.add_source_column("x", {"b": 2.0, "a": 1.0})
+    assert doc.column_type("x") == "number"
+    assert doc.column("x") == {"a": 1.0, "b": 2.0}
+    doc["a", "x"] = 5.0
+    assert doc["a", "x"] == 5
+
+
+def test_save_round_trip_with_missing_values(tmp_path):
+    doc = Document.new()
+    doc["a", "x"] = 1.0
+    doc["b", "name"] = "Bob"
+    doc.add_computed_column("y", "x * 2")
+    doc.filename = str(tmp_path / "doc.json")
+    doc.save()
+
+    loaded = Document.from_file(doc.filename)
+    assert loaded.indexes == ["a", "b"]
+    assert loaded.column_names == ["x", "name", "y"]
+    assert loaded["a", "x"] == 1 and math.isnan(loaded["b", "x"])
+    assert loaded["b", "name"] == "Bob" and math.isnan(loaded["a", "name"])
+    assert loaded["a", "y"] == 2 and math.isnan(loaded["b", "y"])
+    assert not loaded.dirty